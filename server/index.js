@@ -1,6 +1,7 @@
 import express from 'express'
 import cors from 'cors'
 import path from 'path'
+import fs from 'fs-extra'
 import { fileURLToPath } from 'url'
 import { WebSocketServer } from 'ws'
 import http from 'http'
@@ -71,7 +72,7 @@ app.get('/api/images/:imageId/thumb', async (req, res) => {
     const { imageId } = req.params
     const imagePath = path.join(process.cwd(), 'storage', 'thumbs', imageId.substring(0, 2), `${imageId}.webp`)
     
-    if (!fs.existsSync(imagePath)) {
+    if (!(await fs.pathExists(imagePath))) {
       return res.status(404).json({ error: 'Thumbnail not found' })
     }
     
@@ -91,7 +92,7 @@ app.get('/api/images/:imageId/original', async (req, res) => {
     const { imageId } = req.params
     const imagePath = path.join(process.cwd(), 'storage', 'originals', imageId.substring(0, 2), imageId)
     
-    if (!fs.existsSync(imagePath)) {
+    if (!(await fs.pathExists(imagePath))) {
       return res.status(404).json({ error: 'Image not found' })
     }
     
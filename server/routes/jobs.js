@@ -1,6 +1,9 @@
 import { v4 as uuidv4 } from 'uuid'
 import { getDatabase } from '../database/init.js'
 
+// Shared placeholder for images without a result yet (serialized, never mutated)
+const EMPTY_CHAR_CONF = Object.freeze(Array(9).fill(0))
+
 export const setupJobRoutes = (router, services) => {
   const { pipeline } = services
 
@@ -32,30 +35,31 @@ export const setupJobRoutes = (router, services) => {
       return res.status(400).json({ error: 'Job name is required' })
     }
     
-    const jobId = uuidv4()
     const now = new Date().toISOString()
+    const job = {
+      id: uuidv4(),
+      name: name.trim(),
+      description: description.trim(),
+      status: 'CREATED',
+      image_count: 0,
+      created_ts: now,
+      updated_ts: now,
+      started_ts: null,
+      completed_ts: null
+    }
     
     db.run(`
       INSERT INTO jobs (id, name, description, status, created_ts, updated_ts)
       VALUES (?, ?, ?, ?, ?, ?)
-    `, [jobId, name.trim(), description.trim(), 'CREATED', now, now], function(err) {
+    `, [job.id, job.name, job.description, job.status, job.created_ts, job.updated_ts], function(err) {
       if (err) {
         console.error('Error creating job:', err)
         return res.status(500).json({ error: 'Failed to create job' })
       }
       
-      // Return the created job
-      db.get('SELECT * FROM jobs WHERE id = ?', [jobId], (err, job) => {
-        if (err) {
-          console.error('Error fetching created job:', err)
-          return res.status(500).json({ error: 'Job created but failed to fetch' })
-        }
-        
-        res.status(201).json({
-          ...job,
-          image_count: 0
-        })
-      })
+      // Every column of the new row is known here, so return it without
+      // reading it back
+      res.status(201).json(job)
     })
   })
 
@@ -208,7 +212,7 @@ export const setupJobRoutes = (router, services) => {
         ...img,
         status: img.result_status || 'PENDING',
         confidence: img.confidence || 0,
-        per_char_conf: img.per_char_conf ? JSON.parse(img.per_char_conf) : Array(9).fill(0)
+        per_char_conf: img.per_char_conf ? JSON.parse(img.per_char_conf) : EMPTY_CHAR_CONF
       }))
       
       res.json(processedImages)
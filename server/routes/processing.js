@@ -188,7 +188,8 @@ export const setupProcessingRoutes = (router, services) => {
         
         // Test 2: Check if our model is available
         const modelName = process.env.MODEL_NAME || 'benhaotang/Nanonets-OCR-s:latest'
-        if (response.data.models && response.data.models.some(m => m.name.includes(modelName.split(':')[0]))) {
+        const modelBaseName = modelName.split(':')[0]
+        if (response.data.models && response.data.models.some(m => m.name.includes(modelBaseName))) {
           tests.modelAvailable = true
         }
         
@@ -1,4 +1,3 @@
-import express from 'express'
 import logger from '../services/SystemLogger.js'
 import { ProcessingPipeline } from '../services/ProcessingPipeline.js'
 
@@ -1,17 +1,69 @@
 import multer from 'multer'
 import path from 'path'
 import fs from 'fs-extra'
+import zlib from 'zlib'
 import { v4 as uuidv4 } from 'uuid'
-import AdmZip from 'adm-zip'
 import sharp from 'sharp'
 import { getDatabase } from '../database/init.js'
 
+const ALLOWED_MIMES = new Set([
+  'application/zip',
+  'application/x-zip-compressed',
+  'application/x-zip',
+  'image/jpeg',
+  'image/jpg',
+  'image/png',
+  'image/bmp',
+  'image/tiff',
+  'image/tif'
+])
+const IMAGE_EXTENSIONS = new Set(['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'])
+const SUPPORTED_FORMATS = new Set(['jpeg', 'png', 'tiff', 'bmp'])
+const ZIP_METHOD_STORED = 0
+const ZIP_METHOD_DEFLATED = 8
+
+// Lookup table for the CRC-32 that ZIP entries are checked against
+const CRC32_TABLE = new Int32Array(256).map((_, n) => {
+  let c = n
+  for (let k = 0; k < 8; k++) {
+    c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1
+  }
+  return c
+})
+
+// Intelligent defaults based on expected passport image parameters
+const DEFAULT_UPLOAD_SETTINGS = {
+  // Expected image parameters
+  upload_expected_width: 200,
+  upload_expected_height: 500,
+  upload_expected_file_size: 3072, // 3KB in bytes
+  
+  // Tolerance percentages
+  upload_dimension_tolerance: 20, // 20% tolerance for dimensions
+  upload_file_size_tolerance: 25, // 25% tolerance for file size  
+  upload_aspect_ratio_tolerance: 15, // 15% tolerance for aspect ratio
+  
+  // Absolute safety limits
+  upload_min_file_size: 512, // 512 bytes minimum
+  upload_max_file_size: 10485760, // 10MB maximum
+  upload_min_dimension: 10, // 10px minimum
+  upload_max_dimension: 5000 // 5000px maximum
+}
+
+// Directories already created during this process's lifetime
+const ensuredDirs = new Set()
+
+async function ensureDirOnce(dir) {
+  if (ensuredDirs.has(dir)) return
+  await fs.ensureDir(dir)
+  ensuredDirs.add(dir)
+}
+
 // Configure multer for file uploads
 const storage = multer.diskStorage({
   destination: (req, file, cb) => {
     const uploadDir = path.join(process.cwd(), 'temp', 'uploads')
-    fs.ensureDirSync(uploadDir)
-    cb(null, uploadDir)
+    ensureDirOnce(uploadDir).then(() => cb(null, uploadDir), cb)
   },
   filename: (req, file, cb) => {
     const uniqueName = `${Date.now()}-${Math.round(Math.random() * 1E9)}-${file.originalname}`
@@ -26,26 +78,12 @@ const upload = multer({
   },
   fileFilter: (req, file, cb) => {
     // Accept ZIP files and common image formats
-    const allowedMimes = [
-      'application/zip',
-      'application/x-zip-compressed',
-      'application/x-zip',
-      'image/jpeg',
-      'image/jpg',
-      'image/png',
-      'image/bmp',
-      'image/tiff',
-      'image/tif'
-    ]
-    
-    if (allowedMimes.includes(file.mimetype)) {
+    if (ALLOWED_MIMES.has(file.mimetype)) {
       cb(null, true)
     } else {
       // Check file extension as fallback
       const ext = path.extname(file.originalname).toLowerCase()
-      const validExtensions = ['.zip', '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']
-      
-      if (validExtensions.includes(ext)) {
+      if (ext === '.zip' || IMAGE_EXTENSIONS.has(ext)) {
         cb(null, true)
       } else {
         cb(new Error('Invalid file type. Only ZIP files and images are allowed.'))
@@ -74,26 +112,7 @@ export const setupUploadRoutes = (router, services) => {
         }
       })
       
-      // Provide intelligent defaults based on expected parameters
-      const defaultSettings = {
-        // Expected image parameters
-        upload_expected_width: 200,
-        upload_expected_height: 500,
-        upload_expected_file_size: 3072, // 3KB in bytes
-        
-        // Tolerance percentages
-        upload_dimension_tolerance: 20, // 20% tolerance for dimensions
-        upload_file_size_tolerance: 25, // 25% tolerance for file size  
-        upload_aspect_ratio_tolerance: 15, // 15% tolerance for aspect ratio
-        
-        // Absolute safety limits
-        upload_min_file_size: 512, // 512 bytes minimum
-        upload_max_file_size: 10485760, // 10MB maximum
-        upload_min_dimension: 10, // 10px minimum
-        upload_max_dimension: 5000, // 5000px maximum
-      }
-      
-      res.json({ ...defaultSettings, ...settings })
+      res.json({ ...DEFAULT_UPLOAD_SETTINGS, ...settings })
     })
   })
 
@@ -157,10 +176,12 @@ export const setupUploadRoutes = (router, services) => {
         // Single image file - validate using intelligent parameters
         const validation = await validateImageIntelligently(req.file.path, req.file.originalname, validationSettings)
         if (validation.valid) {
+          // Moved into storage from disk rather than read into memory here
           imageFiles = [{
             filename: req.file.originalname,
             path: req.file.path,
-            buffer: fs.readFileSync(req.file.path),
+            sourcePath: req.file.path,
+            size: validation.metadata.size,
             validation: validation
           }]
         } else {
@@ -184,7 +205,7 @@ export const setupUploadRoutes = (router, services) => {
       // Clean up temp files
       await fs.remove(req.file.path)
       for (const file of imageFiles) {
-        if (file.tempPath && fs.existsSync(file.tempPath)) {
+        if (file.tempPath && await fs.pathExists(file.tempPath)) {
           await fs.remove(file.tempPath)
         }
       }
@@ -199,7 +220,7 @@ export const setupUploadRoutes = (router, services) => {
       console.error('Upload error:', error)
       
       // Clean up on error
-      if (req.file && fs.existsSync(req.file.path)) {
+      if (req.file && await fs.pathExists(req.file.path)) {
         await fs.remove(req.file.path)
       }
 
@@ -230,18 +251,7 @@ async function getValidationSettings() {
       if (err) {
         console.error('Error fetching validation settings:', err)
         // Return intelligent defaults on error
-        resolve({
-          upload_expected_width: 200,
-          upload_expected_height: 500,
-          upload_expected_file_size: 3072,
-          upload_dimension_tolerance: 20,
-          upload_file_size_tolerance: 25,
-          upload_aspect_ratio_tolerance: 15,
-          upload_min_file_size: 512,
-          upload_max_file_size: 10485760,
-          upload_min_dimension: 10,
-          upload_max_dimension: 5000
-        })
+        resolve({ ...DEFAULT_UPLOAD_SETTINGS })
         return
       }
       
@@ -255,20 +265,7 @@ async function getValidationSettings() {
       })
       
       // Merge with intelligent defaults
-      const defaultSettings = {
-        upload_expected_width: 200,
-        upload_expected_height: 500,
-        upload_expected_file_size: 3072,
-        upload_dimension_tolerance: 20,
-        upload_file_size_tolerance: 25,
-        upload_aspect_ratio_tolerance: 15,
-        upload_min_file_size: 512,
-        upload_max_file_size: 10485760,
-        upload_min_dimension: 10,
-        upload_max_dimension: 5000
-      }
-      
-      resolve({ ...defaultSettings, ...settings })
+      resolve({ ...DEFAULT_UPLOAD_SETTINGS, ...settings })
     })
   })
 }
@@ -277,6 +274,8 @@ async function extractImagesFromZipIntelligently(zipPath, validationSettings) {
   const imageFiles = []
   
   try {
+    // Only ZIP uploads need adm-zip, so load it on first use
+    const AdmZip = (await import('adm-zip')).default
     const zip = new AdmZip(zipPath)
     const entries = zip.getEntries()
 
@@ -289,13 +288,13 @@ async function extractImagesFromZipIntelligently(zipPath, validationSettings) {
       const ext = path.extname(filename).toLowerCase()
       
       // Check if it's an image file
-      if (['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'].includes(ext)) {
+      if (IMAGE_EXTENSIONS.has(ext)) {
         try {
-          const buffer = entry.getData()
+          const buffer = await readZipEntry(entry)
           
           if (buffer && buffer.length > 0) {
             // Validate using intelligent parameters
-            const tempPath = path.join(process.cwd(), 'temp', `extract_${Date.now()}_${path.basename(filename)}`)
+            const tempPath = path.join(process.cwd(), 'temp', `extract_${uuidv4()}${ext}`)
             await fs.writeFile(tempPath, buffer)
             
             const validation = await validateImageIntelligently(tempPath, filename, validationSettings)
@@ -304,7 +303,8 @@ async function extractImagesFromZipIntelligently(zipPath, validationSettings) {
               imageFiles.push({
                 filename: path.basename(filename),
                 path: filename,
-                buffer: buffer,
+                sourcePath: tempPath,
+                size: buffer.length,
                 tempPath: tempPath,
                 validation: validation
               })
@@ -329,6 +329,51 @@ async function extractImagesFromZipIntelligently(zipPath, validationSettings) {
   return imageFiles
 }
 
+async function readZipEntry(entry) {
+  // Inflate off the request's critical path: getData() decompresses
+  // synchronously and blocks the event loop for large archives. zlib
+  // reports a corrupt deflate stream through the callback, so a bad entry
+  // fails on its own instead of hanging or crashing the upload
+  if (entry.header.encrypted) {
+    throw new Error('Encrypted ZIP entries are not supported')
+  }
+
+  const compressed = entry.getCompressedData()
+  let data
+
+  switch (entry.header.method) {
+    case ZIP_METHOD_STORED:
+      data = compressed
+      break
+    case ZIP_METHOD_DEFLATED:
+      data = await new Promise((resolve, reject) => {
+        zlib.inflateRaw(compressed, (err, inflated) => {
+          if (err) reject(err)
+          else resolve(inflated)
+        })
+      })
+      break
+    default:
+      throw new Error(`Unsupported ZIP compression method ${entry.header.method}`)
+  }
+
+  // getData() verified the checksum; keep rejecting entries that are
+  // damaged but still decode
+  if (crc32(data) !== entry.header.crc) {
+    throw new Error('CRC32 mismatch')
+  }
+
+  return data
+}
+
+function crc32(buffer) {
+  let crc = -1
+  for (let i = 0; i < buffer.length; i++) {
+    crc = CRC32_TABLE[(crc ^ buffer[i]) & 0xff] ^ (crc >>> 8)
+  }
+  return (crc ^ -1) >>> 0
+}
+
 async function validateImageIntelligently(imagePath, filename, settings) {
   try {
     // Check file exists and has content
@@ -404,8 +449,7 @@ async function validateImageIntelligently(imagePath, filename, settings) {
     }
 
     // Check supported formats
-    const supportedFormats = ['jpeg', 'png', 'tiff', 'bmp']
-    if (!supportedFormats.includes(metadata.format)) {
+    if (!SUPPORTED_FORMATS.has(metadata.format)) {
       return { 
         valid: false, 
         reason: `Unsupported format: ${metadata.format}` 
@@ -449,36 +493,44 @@ async function processUploadedImages(imageFiles, jobId) {
   }
 
   for (const imageFile of imageFiles) {
+    let originalPath = null
+    let partialPath = null
+
     try {
       const imageId = uuidv4()
       const fileExtension = path.extname(imageFile.filename).toLowerCase()
+      const fileSize = imageFile.size
       const sanitizedFilename = imageFile.filename.replace(/[^a-zA-Z0-9.-]/g, '_')
       
-      // Create directory structure
-      const subDir = imageId.substring(0, 2)
-      const originalDir = path.join(process.cwd(), 'storage', 'originals', subDir)
-      await fs.ensureDir(originalDir)
-      
-      // Save original image
-      const originalPath = path.join(originalDir, imageId + fileExtension)
-      await fs.writeFile(originalPath, imageFile.buffer)
-
-      // Check for duplicates (basic filename and size check)
-      const existingImage = await checkForExistingImage(db, sanitizedFilename, jobId, imageFile.buffer.length)
+      // Check for duplicates (basic filename and size check) before
+      // spending any disk writes on the image
+      const existingImage = await checkForExistingImage(db, sanitizedFilename, jobId, fileSize)
       if (existingImage) {
         results.duplicates++
-        await fs.remove(originalPath)
         console.log(`Duplicate detected: ${sanitizedFilename}`)
         continue
       }
 
+      // Create directory structure
+      const subDir = imageId.substring(0, 2)
+      const originalDir = path.join(process.cwd(), 'storage', 'originals', subDir)
+      await ensureDirOnce(originalDir)
+      
+      // Move the already-written temp file into storage (a rename on the
+      // same filesystem) via a .partial name so a cross-device copy is
+      // never visible at the final path
+      originalPath = path.join(originalDir, imageId + fileExtension)
+      partialPath = `${originalPath}.partial`
+      await fs.move(imageFile.sourcePath, partialPath, { overwrite: true })
+      await fs.rename(partialPath, originalPath)
+
       // Insert into database with validation metadata
       await insertImageRecord(db, {
         id: imageId,
         jobId: jobId,
         filename: sanitizedFilename,
         originalPath: originalPath,
-        fileSize: imageFile.buffer.length,
+        fileSize: fileSize,
         uploadTime: new Date().toISOString(),
         metadata: imageFile.validation?.metadata
       })
@@ -490,12 +542,19 @@ async function processUploadedImages(imageFiles, jobId) {
       results.failed++
       results.errors.push(`Failed to process ${imageFile.filename}: ${error.message}`)
       console.error(`Error processing ${imageFile.filename}:`, error)
+
+      // Don't leave an orphaned file in storage without a database row
+      for (const leftover of [partialPath, originalPath]) {
+        if (leftover) {
+          await fs.remove(leftover).catch(() => {})
+        }
+      }
     }
   }
 
   // Update job image count
   if (results.successful > 0) {
-    await updateJobImageCount(db, jobId)
+    await updateJobImageCount(db, jobId, results.successful)
   }
 
   return results
@@ -536,16 +595,16 @@ function insertImageRecord(db, imageData) {
   })
 }
 
-function updateJobImageCount(db, jobId) {
+function updateJobImageCount(db, jobId, addedCount) {
+  // Bump the stored count by the images just inserted rather than
+  // recounting every image in the job
   return new Promise((resolve, reject) => {
     db.run(`
       UPDATE jobs 
-      SET image_count = (
-        SELECT COUNT(*) FROM images WHERE job_id = ?
-      ),
+      SET image_count = COALESCE(image_count, 0) + ?,
       updated_ts = CURRENT_TIMESTAMP
       WHERE id = ?
-    `, [jobId, jobId], function(err) {
+    `, [addedCount, jobId], function(err) {
       if (err) reject(err)
       else resolve(this.changes)
     })
@@ -1,10 +1,19 @@
 import EventEmitter from 'events'
 import axios from 'axios'
+import http from 'http'
+import https from 'https'
 import sharp from 'sharp'
 import fs from 'fs-extra'
 import path from 'path'
 import { getDatabase } from '../database/init.js'
 import { logSystem } from './SystemLogger.js'
+import { TokenBucket } from './rateLimiter.js'
+
+// Shared client so model requests reuse pooled keep-alive connections
+const modelClient = axios.create({
+  httpAgent: new http.Agent({ keepAlive: true }),
+  httpsAgent: new https.Agent({ keepAlive: true })
+})
 
 export class ProcessingPipeline extends EventEmitter {
   constructor() {
@@ -14,7 +23,7 @@ export class ProcessingPipeline extends EventEmitter {
     this.processedCount = 0
     this.totalCount = 0
     this.abortController = null
-    this.batchSize = 5 // Process 5 images at a time
+    this.batchSize = 5 // Process up to 5 images at a time
     
     // Model configuration from environment
     this.modelUrl = process.env.MODEL_URL || 'http://10.4.0.15:11434'
@@ -23,6 +32,10 @@ export class ProcessingPipeline extends EventEmitter {
     this.patternRegex = new RegExp(process.env.PATTERN_REGEX || '^(?:(?:[CDES][0-9]{8})|(?:[CDESN]{2}[0-9]{7}))$')
     this.confThreshold = parseInt(process.env.CONF_THRESHOLD) || 80
     
+    // Optional cap on model requests per minute (unset or 0 = unlimited)
+    const modelRpm = parseInt(process.env.MODEL_RPM) || 0
+    this.modelRateLimiter = modelRpm > 0 ? new TokenBucket(modelRpm) : null
+    
     logSystem('info', 'ProcessingPipeline', 'Pipeline initialized', {
       modelUrl: this.modelUrl,
       modelName: this.modelName,
@@ -70,24 +83,8 @@ export class ProcessingPipeline extends EventEmitter {
       // Update job status
       await this.updateJobStatus(db, jobId, 'PROCESSING')
 
-      // Process images in batches
-      for (let i = 0; i < images.length; i += this.batchSize) {
-        if (this.abortController.signal.aborted) {
-          logSystem('info', 'ProcessingPipeline', 'Processing aborted by user')
-          break
-        }
-
-        const batch = images.slice(i, i + this.batchSize)
-        await this.processBatch(batch)
-
-        // Emit progress update
-        this.emit('progress', {
-          jobId,
-          processed: this.processedCount,
-          total: this.totalCount,
-          percentage: Math.round((this.processedCount / this.totalCount) * 100)
-        })
-      }
+      // Process images with a fixed number in flight
+      await this.processImagesConcurrently(jobId, images)
 
       // Final status update
       if (!this.abortController.signal.aborted) {
@@ -99,7 +96,11 @@ export class ProcessingPipeline extends EventEmitter {
         })
       } else {
         await this.updateJobStatus(db, jobId, 'PAUSED')
-        logSystem('info', 'ProcessingPipeline', 'Job processing paused', { jobId })
+        logSystem('info', 'ProcessingPipeline', 'Job processing paused by user', {
+          jobId,
+          processed: this.processedCount,
+          total: this.totalCount
+        })
       }
 
       this.emit('jobCompleted', { jobId, processed: this.processedCount, total: this.totalCount })
@@ -131,13 +132,46 @@ export class ProcessingPipeline extends EventEmitter {
     }
   }
 
-  async processBatch(images) {
-    const promises = images.map(image => this.processImage(image))
-    await Promise.allSettled(promises)
+  async processImagesConcurrently(jobId, images) {
+    // Each consumer pulls the next image as soon as its current one
+    // finishes, so one slow model call no longer holds up a whole batch
+    let nextIndex = 0
+    const signal = this.abortController.signal
+
+    const consumer = async () => {
+      while (nextIndex < images.length && !signal.aborted) {
+        const image = images[nextIndex++]
+        try {
+          await this.processImage(image)
+        } catch (error) {
+          logSystem('error', 'ProcessingPipeline', 'Failed to record image result', {
+            imageId: image.id,
+            error: error.message
+          })
+        } finally {
+          // Count here so an image whose error result could not be saved
+          // still advances progress and the final update is always sent
+          this.processedCount++
+
+          // Emit progress update every batchSize images and on the last one
+          if (this.processedCount % this.batchSize === 0 || this.processedCount === this.totalCount) {
+            this.emit('progress', {
+              jobId,
+              processed: this.processedCount,
+              total: this.totalCount,
+              percentage: Math.round((this.processedCount / this.totalCount) * 100)
+            })
+          }
+        }
+      }
+    }
+
+    const consumerCount = Math.min(this.batchSize, images.length)
+    await Promise.all(Array.from({ length: consumerCount }, consumer))
   }
 
   async processImage(image) {
-    const startTime = Date.now()
+    const startTime = performance.now()
     logSystem('info', 'ProcessingPipeline', 'Processing image', { 
       imageId: image.id, 
       filename: image.filename 
@@ -154,11 +188,9 @@ export class ProcessingPipeline extends EventEmitter {
       const processedResult = await this.processOCRResult(ocrResult, image)
       
       // Save result to database
-      await this.saveResult(image.id, processedResult)
+      await this.saveResult(image, processedResult)
       
-      this.processedCount++
-      
-      const processingTime = Date.now() - startTime
+      const processingTime = Math.round(performance.now() - startTime)
       logSystem('success', 'ProcessingPipeline', 'Image processed successfully', {
         imageId: image.id,
         filename: image.filename,
@@ -174,28 +206,48 @@ export class ProcessingPipeline extends EventEmitter {
       })
 
     } catch (error) {
+      // An image interrupted by pause or stop gets no result, so it stays
+      // pending and is picked up again when the job is resumed
+      if (this.abortController?.signal.aborted) {
+        logSystem('info', 'ProcessingPipeline', 'Image processing cancelled', {
+          imageId: image.id,
+          filename: image.filename
+        })
+        return
+      }
+
       logSystem('error', 'ProcessingPipeline', 'Image processing failed', {
         imageId: image.id,
         filename: image.filename,
         error: error.message
       })
 
-      await this.saveResult(image.id, {
+      await this.saveResult(image, {
         passport_number: null,
         confidence: 0,
         status: 'ERROR',
         error: error.message,
         per_char_conf: Array(9).fill(0)
       })
-
-      this.processedCount++
     }
   }
 
   async prepareImage(imagePath) {
     try {
+      // sRGB JPEGs that already fit the target box and need no EXIF rotation
+      // would come back unchanged apart from a lossy re-encode, so send the
+      // file as-is
+      const image = sharp(imagePath)
+      const { format, width, height, space, orientation } = await image.metadata()
+      if (
+        format === 'jpeg' && width <= 800 && height <= 600 &&
+        space === 'srgb' && (!orientation || orientation === 1)
+      ) {
+        return await fs.readFile(imagePath)
+      }
+
       // Load and optionally preprocess image
-      const buffer = await sharp(imagePath)
+      const buffer = await image
         .resize(800, 600, { fit: 'inside', withoutEnlargement: true })
         .jpeg({ quality: 90 })
         .toBuffer()
@@ -217,7 +269,11 @@ export class ProcessingPipeline extends EventEmitter {
 
       const base64Image = imageBuffer.toString('base64')
       
-      const response = await axios.post(`${this.modelUrl}/api/generate`, {
+      if (this.modelRateLimiter) {
+        await this.modelRateLimiter.acquire(this.abortController?.signal)
+      }
+      
+      const response = await modelClient.post(`${this.modelUrl}/api/generate`, {
         model: this.modelName,
         prompt: this.visionPrompt,
         images: [base64Image],
@@ -242,7 +298,8 @@ export class ProcessingPipeline extends EventEmitter {
       }
 
     } catch (error) {
-      if (error.name === 'AbortError') {
+      // axios reports an aborted request as a CanceledError, not an AbortError
+      if (axios.isCancel(error) || error.name === 'AbortError') {
         throw new Error('Processing was cancelled')
       }
       
@@ -262,10 +319,12 @@ export class ProcessingPipeline extends EventEmitter {
       // Try to parse JSON response
       let parsedResponse
       
-      // Clean up the response - sometimes Ollama returns extra text
-      const jsonMatch = rawResponse.match(/\{[^}]*\}/)
-      if (jsonMatch) {
-        parsedResponse = JSON.parse(jsonMatch[0])
+      // Clean up the response - sometimes Ollama returns extra text.
+      // Locate the first flat {...} block directly instead of regex-scanning
+      const jsonStart = rawResponse.indexOf('{')
+      const jsonEnd = jsonStart === -1 ? -1 : rawResponse.indexOf('}', jsonStart)
+      if (jsonEnd !== -1) {
+        parsedResponse = JSON.parse(rawResponse.slice(jsonStart, jsonEnd + 1))
       } else {
         // Fallback: try to extract passport number with regex
         const passportMatch = rawResponse.match(/([CDESN]{1,2}\d{7,8})/i)
@@ -333,41 +392,36 @@ export class ProcessingPipeline extends EventEmitter {
     }
   }
 
-  async saveResult(imageId, result) {
+  async saveResult(image, result) {
     const db = getDatabase()
     
     return new Promise((resolve, reject) => {
-      // First, get the current max version for this image
-      db.get('SELECT MAX(version) as max_version FROM results WHERE image_id = ?', [imageId], (err, row) => {
+      // Derive the next version inside the INSERT so saving takes a single
+      // statement and no other write can interleave between read and insert
+      db.run(`
+        INSERT INTO results (
+          image_id, job_id, version, passport_number, confidence, status,
+          per_char_conf, reasons, raw_response, ts
+        ) VALUES (
+          ?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM results WHERE image_id = ?),
+          ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP
+        )
+      `, [
+        image.id,
+        image.job_id,
+        image.id,
+        result.passport_number,
+        result.confidence,
+        result.status,
+        JSON.stringify(result.per_char_conf),
+        result.reasons,
+        result.raw_response
+      ], function(err) {
         if (err) {
           reject(err)
-          return
+        } else {
+          resolve(this.lastID)
         }
-
-        const version = (row?.max_version || 0) + 1
-
-        db.run(`
-          INSERT INTO results (
-            image_id, version, passport_number, confidence, status,
-            per_char_conf, reasons, raw_response, format_valid, created_ts
-          ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        `, [
-          imageId,
-          version,
-          result.passport_number,
-          result.confidence,
-          result.status,
-          JSON.stringify(result.per_char_conf),
-          result.reasons,
-          result.raw_response,
-          result.format_valid ? 1 : 0
-        ], function(err) {
-          if (err) {
-            reject(err)
-          } else {
-            resolve(this.lastID)
-          }
-        })
       })
     })
   }
@@ -1,11 +1,30 @@
 import fs from 'fs-extra'
 import path from 'path'
 
+// Console colors per level, shared by every log call
+const LEVEL_COLORS = {
+  debug: '\x1b[36m',   // Cyan
+  info: '\x1b[34m',    // Blue
+  warn: '\x1b[33m',    // Yellow
+  error: '\x1b[31m',   // Red
+  success: '\x1b[32m', // Green
+  reset: '\x1b[0m'
+}
+
 class SystemLogger {
   constructor() {
     this.logs = []
     this.maxLogEntries = 10000
+    this.trimSlack = 1000
     this.logLevels = ['debug', 'info', 'warn', 'error', 'success']
+    this.pendingFileLines = []
+    this.flushTimer = null
+    this.flushPromise = null
+    this.inFlightLines = ''
+    this.flushDelayMs = 250
+    this.logDir = path.join(process.cwd(), 'logs')
+    this.logRetentionDays = parseInt(process.env.LOG_RETENTION_DAYS) || 14
+    this.currentLogFile = null
     
     // Initialize log storage
     this.initializeLogger()
@@ -29,75 +48,146 @@ class SystemLogger {
     // Add to in-memory store
     this.logs.push(logEntry)
 
-    // Keep only recent logs in memory
+    // Keep only recent logs in memory. Trim in chunks down to
+    // maxLogEntries - trimSlack so the array is not shifted on every entry
+    // once the cap is reached, and never holds more than maxLogEntries
     if (this.logs.length > this.maxLogEntries) {
-      this.logs = this.logs.slice(-this.maxLogEntries)
+      this.logs.splice(0, this.logs.length - (this.maxLogEntries - this.trimSlack))
     }
 
     // Console output with colors
-    const colors = {
-      debug: '\x1b[36m',   // Cyan
-      info: '\x1b[34m',    // Blue
-      warn: '\x1b[33m',    // Yellow
-      error: '\x1b[31m',   // Red
-      success: '\x1b[32m', // Green
-      reset: '\x1b[0m'
-    }
-
-    const color = colors[level] || colors.reset
-    const resetColor = colors.reset
+    const color = LEVEL_COLORS[level] || LEVEL_COLORS.reset
+    const resetColor = LEVEL_COLORS.reset
 
     console.log(
       `${color}[${timestamp}] ${level.toUpperCase()} [${component}] ${message}${resetColor}`,
-      details ? JSON.stringify(details, null, 2) : ''
+      details ? JSON.stringify(details) : ''
     )
 
     // Persist critical logs to file (async, non-blocking)
     if (level === 'error' || level === 'warn') {
-      this.persistLogToFile(logEntry).catch(err => {
-        console.error('Failed to persist log to file:', err)
-      })
+      this.persistLogToFile(logEntry)
     }
   }
 
-  async persistLogToFile(logEntry) {
+  persistLogToFile(logEntry) {
+    const logLine = `${logEntry.timestamp} [${logEntry.level.toUpperCase()}] [${logEntry.component}] ${logEntry.message}${logEntry.details ? ' ' + JSON.stringify(logEntry.details) : ''}\n`
+    this.pendingFileLines.push(logLine)
+    this.scheduleLogFlush()
+  }
+
+  scheduleLogFlush() {
+    // Coalesce bursts of warnings/errors into a single append. Only one flush
+    // runs at a time; the next timer is armed once the current one settles
+    if (this.flushTimer || this.flushPromise) return
+
+    this.flushTimer = setTimeout(() => {
+      this.flushTimer = null
+      this.flushPromise = this.flushLogFile()
+        .catch(err => {
+          console.error('Failed to persist log to file:', err)
+        })
+        .finally(() => {
+          this.flushPromise = null
+          if (this.pendingFileLines.length > 0) {
+            this.scheduleLogFlush()
+          }
+        })
+    }, this.flushDelayMs)
+  }
+
+  async flushLogFile() {
+    if (this.pendingFileLines.length === 0) return
+
+    const lines = this.pendingFileLines.join('')
+    this.pendingFileLines = []
+    this.inFlightLines = lines
+
     try {
-      const logDir = path.join(process.cwd(), 'logs')
-      await fs.ensureDir(logDir)
-      
-      const logFile = path.join(logDir, `system-${new Date().toISOString().split('T')[0]}.log`)
-      const logLine = `${logEntry.timestamp} [${logEntry.level.toUpperCase()}] [${logEntry.component}] ${logEntry.message}${logEntry.details ? ' ' + JSON.stringify(logEntry.details) : ''}\n`
-      
-      await fs.appendFile(logFile, logLine)
+      await fs.ensureDir(this.logDir)
+
+      const logFile = this.getLogFilePath()
+      await fs.appendFile(logFile, lines)
+
+      // Prune old daily files whenever a new day's file is started
+      if (logFile !== this.currentLogFile) {
+        this.currentLogFile = logFile
+        await this.pruneOldLogFiles()
+      }
     } catch (error) {
       console.error('Failed to write log file:', error)
+    } finally {
+      this.inFlightLines = ''
     }
   }
 
-  getLogs(filters = {}) {
-    let filteredLogs = [...this.logs]
+  flushLogFileSync() {
+    // Include lines taken by an unfinished async flush: exiting abandons it,
+    // and a possible duplicate line beats a lost one
+    const lines = this.inFlightLines + this.pendingFileLines.join('')
+    if (lines.length === 0) return
 
-    if (filters.level && filters.level !== 'all') {
-      filteredLogs = filteredLogs.filter(log => log.level === filters.level)
-    }
+    this.inFlightLines = ''
+    this.pendingFileLines = []
 
-    if (filters.component) {
-      filteredLogs = filteredLogs.filter(log => 
-        log.component.toLowerCase().includes(filters.component.toLowerCase())
-      )
+    try {
+      fs.ensureDirSync(this.logDir)
+      fs.appendFileSync(this.getLogFilePath(), lines)
+    } catch (error) {
+      console.error('Failed to write log file:', error)
     }
+  }
 
-    if (filters.search) {
-      const searchLower = filters.search.toLowerCase()
-      filteredLogs = filteredLogs.filter(log => 
-        log.message.toLowerCase().includes(searchLower) ||
-        log.component.toLowerCase().includes(searchLower)
-      )
+  async pruneOldLogFiles() {
+    const files = (await fs.readdir(this.logDir))
+      .filter(name => /^system-\d{4}-\d{2}-\d{2}\.log$/.test(name))
+      .sort()
+
+    const expired = files.slice(0, Math.max(0, files.length - this.logRetentionDays))
+    for (const name of expired) {
+      await fs.remove(path.join(this.logDir, name))
     }
+  }
+
+  getLogFilePath() {
+    return path.join(this.logDir, `system-${new Date().toISOString().slice(0, 10)}.log`)
+  }
+
+  getLogs(filters = {}) {
+    // Every step below produces a new array, so no defensive copy is needed
+    let filteredLogs = this.logs
 
     if (filters.since) {
+      // Entries are appended in time order, so skip straight to the first match.
+      // Timestamps are fixed-width UTC ISO strings, so they compare
+      // chronologically as plain strings without parsing each entry
       const sinceDate = new Date(filters.since)
-      filteredLogs = filteredLogs.filter(log => new Date(log.timestamp) >= sinceDate)
+      if (isNaN(sinceDate.getTime())) {
+        filteredLogs = []
+      } else {
+        const sinceIso = sinceDate.toISOString()
+        filteredLogs = this.logs.slice(this.findFirstIndex(log => log.timestamp >= sinceIso))
+      }
+    }
+
+    // Apply the level, component and search filters in one pass, lowercasing
+    // each entry's component at most once
+    const level = filters.level && filters.level !== 'all' ? filters.level : null
+    const componentLower = filters.component ? filters.component.toLowerCase() : null
+    const searchLower = filters.search ? filters.search.toLowerCase() : null
+
+    if (level || componentLower || searchLower) {
+      filteredLogs = filteredLogs.filter(log => {
+        if (level && log.level !== level) return false
+        if (!componentLower && !searchLower) return true
+
+        const logComponent = log.component.toLowerCase()
+        if (componentLower && !logComponent.includes(componentLower)) return false
+
+        return !searchLower ||
+          log.message.toLowerCase().includes(searchLower) ||
+          logComponent.includes(searchLower)
+      })
     }
 
     return filteredLogs.slice(-1000) // Return last 1000 entries
@@ -117,26 +207,54 @@ class SystemLogger {
 
   getStats() {
     const now = Date.now()
-    const oneHourAgo = now - (60 * 60 * 1000)
-    const recentLogs = this.logs.filter(log => new Date(log.timestamp).getTime() > oneHourAgo)
+    const oneHourAgo = new Date(now - (60 * 60 * 1000)).toISOString()
 
     const stats = {
       total: this.logs.length,
-      recent: recentLogs.length,
+      recent: 0,
       byLevel: {}
     }
 
     this.logLevels.forEach(level => {
-      stats.byLevel[level] = this.logs.filter(log => log.level === level).length
+      stats.byLevel[level] = 0
     })
 
+    for (const log of this.logs) {
+      if (Object.hasOwn(stats.byLevel, log.level)) {
+        stats.byLevel[log.level]++
+      }
+    }
+
+    // Recent entries form a suffix of the log, so only its start needs locating
+    stats.recent = this.logs.length -
+      this.findFirstIndex(log => log.timestamp > oneHourAgo)
+
     return stats
   }
+
+  findFirstIndex(predicate) {
+    // Binary search for the first entry matching a predicate that is
+    // monotonic over the chronologically ordered log
+    let low = 0
+    let high = this.logs.length
+    while (low < high) {
+      const mid = (low + high) >>> 1
+      if (predicate(this.logs[mid])) {
+        high = mid
+      } else {
+        low = mid + 1
+      }
+    }
+    return low
+  }
 }
 
 // Global logger instance
 const logger = new SystemLogger()
 
+// Don't lose buffered warnings/errors on shutdown
+process.on('exit', () => logger.flushLogFileSync())
+
 // Convenience function for logging
 export function logSystem(level, component, message, details = null) {
   logger.log(level, component, message, details)
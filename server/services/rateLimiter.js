@@ -0,0 +1,35 @@
+import { setTimeout as sleep } from 'timers/promises'
+
+export class TokenBucket {
+  constructor(ratePerMinute, capacity = ratePerMinute) {
+    this.ratePerMs = ratePerMinute / 60000
+    this.capacity = capacity
+    this.tokens = capacity
+    this.lastRefill = Date.now()
+    this.queue = Promise.resolve()
+  }
+
+  refill() {
+    const now = Date.now()
+    this.tokens = Math.min(this.capacity, this.tokens + (now - this.lastRefill) * this.ratePerMs)
+    this.lastRefill = now
+  }
+
+  // Resolves once a token is available; callers are served in arrival order.
+  // Aborting the signal rejects the wait without spending a token
+  acquire(signal) {
+    const turn = this.queue.then(async () => {
+      signal?.throwIfAborted()
+      this.refill()
+      if (this.tokens < 1) {
+        const waitMs = Math.ceil((1 - this.tokens) / this.ratePerMs)
+        await sleep(waitMs, undefined, { signal })
+        this.refill()
+      }
+      this.tokens -= 1
+    })
+    // A rejected turn must not stall the callers queued behind it
+    this.queue = turn.catch(() => {})
+    return turn
+  }
+}
@@ -0,0 +1,54 @@
+import { test } from 'node:test'
+import assert from 'node:assert/strict'
+import { TokenBucket } from '../server/services/rateLimiter.js'
+
+test('a full bucket serves a burst up to its capacity without waiting', async () => {
+  const bucket = new TokenBucket(60, 3)
+  const start = Date.now()
+
+  await Promise.all([bucket.acquire(), bucket.acquire(), bucket.acquire()])
+
+  assert.ok(Date.now() - start < 100)
+  assert.ok(bucket.tokens < 1)
+})
+
+test('refill adds tokens at the configured rate up to capacity', () => {
+  const bucket = new TokenBucket(60, 5) // one token per second
+  bucket.tokens = 0
+  bucket.lastRefill = Date.now() - 2000
+
+  bucket.refill()
+  assert.ok(bucket.tokens >= 2 && bucket.tokens < 2.5)
+
+  bucket.lastRefill = Date.now() - 60000
+  bucket.refill()
+  assert.equal(bucket.tokens, 5)
+})
+
+test('an empty bucket waits for the next token', async () => {
+  const bucket = new TokenBucket(600, 1) // one token per 100ms
+  await bucket.acquire()
+  const start = Date.now()
+
+  await bucket.acquire()
+
+  assert.ok(Date.now() - start >= 50)
+})
+
+test('aborting a wait rejects it without spending a token', async () => {
+  const bucket = new TokenBucket(1, 1) // one token per minute
+  await bucket.acquire()
+
+  const controller = new AbortController()
+  const waiting = bucket.acquire(controller.signal)
+  const queued = bucket.acquire(controller.signal)
+  setTimeout(() => controller.abort(), 20)
+
+  await assert.rejects(waiting, { name: 'AbortError' })
+  await assert.rejects(queued, { name: 'AbortError' })
+  assert.ok(bucket.tokens >= 0 && bucket.tokens < 1)
+
+  // Later callers are not stalled behind the aborted waits
+  bucket.tokens = 1
+  await bucket.acquire()
+})
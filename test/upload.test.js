@@ -0,0 +1,173 @@
+import { test, before, after } from 'node:test'
+import assert from 'node:assert/strict'
+import os from 'os'
+import path from 'path'
+import fs from 'fs-extra'
+import express from 'express'
+import AdmZip from 'adm-zip'
+import sharp from 'sharp'
+
+let server
+let baseUrl
+let workDir
+let originalCwd
+let closeDatabase
+let getDatabase
+
+before(async () => {
+  // Uploads, temp files and the database all live under the working directory
+  originalCwd = process.cwd()
+  workDir = await fs.mkdtemp(path.join(os.tmpdir(), 'passport-ocr-upload-'))
+  process.chdir(workDir)
+  process.env.DATABASE_PATH = path.join(workDir, 'data', 'test.db')
+
+  const database = await import('../server/database/init.js')
+  const { setupUploadRoutes } = await import('../server/routes/upload.js')
+  closeDatabase = database.closeDatabase
+  getDatabase = database.getDatabase
+  await database.initDatabase()
+
+  // Widen the file size window so small generated JPEGs pass validation
+  await saveSettings({
+    upload_expected_file_size: 50000,
+    upload_file_size_tolerance: 99,
+    upload_min_file_size: 1
+  })
+
+  const app = express()
+  const router = express.Router()
+  setupUploadRoutes(router, {})
+  app.use('/api', router)
+
+  await new Promise(resolve => {
+    server = app.listen(0, resolve)
+  })
+  baseUrl = `http://127.0.0.1:${server.address().port}/api`
+})
+
+after(async () => {
+  await new Promise(resolve => server.close(resolve))
+  await closeDatabase()
+  process.chdir(originalCwd)
+  await fs.remove(workDir)
+})
+
+function saveSettings(settings) {
+  const db = getDatabase()
+  return Promise.all(Object.entries(settings).map(([key, value]) => new Promise((resolve, reject) => {
+    db.run(
+      'INSERT OR REPLACE INTO settings (key, value, updated_ts) VALUES (?, ?, CURRENT_TIMESTAMP)',
+      [key, JSON.stringify(value)],
+      err => (err ? reject(err) : resolve())
+    )
+  })))
+}
+
+function getJobImages(jobId) {
+  return new Promise((resolve, reject) => {
+    getDatabase().all(
+      'SELECT filename, original_path FROM images WHERE job_id = ? ORDER BY filename',
+      [jobId],
+      (err, rows) => (err ? reject(err) : resolve(rows))
+    )
+  })
+}
+
+function passportImage(background) {
+  return sharp({
+    create: { width: 200, height: 500, channels: 3, background }
+  }).jpeg().toBuffer()
+}
+
+function buildZip(files) {
+  const zip = new AdmZip()
+  for (const { name, data, method } of files) {
+    zip.addFile(name, data)
+    zip.getEntry(name).header.method = method
+  }
+  return zip.toBuffer()
+}
+
+// Byte offset of the first entry's data within an archive
+function firstEntryDataStart(archive) {
+  const nameLength = archive.readUInt16LE(26)
+  const extraLength = archive.readUInt16LE(28)
+  return 30 + nameLength + extraLength
+}
+
+async function uploadZip(jobId, archive) {
+  const form = new FormData()
+  form.append('jobId', jobId)
+  form.append('uploadType', 'zip')
+  form.append('file', new Blob([archive], { type: 'application/zip' }), 'upload.zip')
+
+  const response = await fetch(`${baseUrl}/upload`, {
+    method: 'POST',
+    body: form,
+    signal: AbortSignal.timeout(10000)
+  })
+  return { status: response.status, body: await response.json() }
+}
+
+function buildZipWithBadDeflate() {
+  // Highly compressible content so adm-zip stores the entry deflated
+  const zip = new AdmZip()
+  zip.addFile('passport.jpg', Buffer.alloc(64 * 1024, 0xff))
+  const archive = zip.toBuffer()
+
+  // Overwrite the entry's compressed bytes: 0xff starts a deflate block of
+  // reserved type 3, which zlib rejects as an invalid block type
+  const entry = new AdmZip(archive).getEntries()[0]
+  assert.equal(entry.header.method, 8)
+  const dataStart = firstEntryDataStart(archive)
+  archive.fill(0xff, dataStart, dataStart + entry.header.compressedSize)
+
+  return archive
+}
+
+test('upload of a ZIP with a corrupt deflate stream fails cleanly', async () => {
+  const { status, body } = await uploadZip('job-corrupt-zip', buildZipWithBadDeflate())
+
+  assert.equal(status, 400)
+  assert.equal(body.success, false)
+  assert.match(body.error, /No valid passport images/)
+})
+
+test('upload of a ZIP entry that fails its CRC check is rejected', async () => {
+  const image = await passportImage('#336699')
+  const archive = buildZip([{ name: 'damaged.jpg', data: image, method: 0 }])
+
+  // Flip a byte inside the stored JPEG's scan data: the image still parses,
+  // only the checksum catches the damage
+  const dataStart = firstEntryDataStart(archive)
+  archive[dataStart + image.length - 16] ^= 0xff
+
+  const { status, body } = await uploadZip('job-bad-crc', archive)
+
+  assert.equal(status, 400)
+  assert.match(body.error, /No valid passport images/)
+  assert.deepEqual(await getJobImages('job-bad-crc'), [])
+})
+
+test('upload of a ZIP stores valid stored and deflated entries', async () => {
+  const stored = await passportImage('#224466')
+  const deflated = await passportImage('#884422')
+  const archive = buildZip([
+    { name: 'stored.jpg', data: stored, method: 0 },
+    { name: 'deflated.jpg', data: deflated, method: 8 }
+  ])
+  const methods = Object.fromEntries(
+    new AdmZip(archive).getEntries().map(entry => [entry.entryName, entry.header.method])
+  )
+  assert.deepEqual(methods, { 'stored.jpg': 0, 'deflated.jpg': 8 })
+
+  const { status, body } = await uploadZip('job-valid-zip', archive)
+
+  assert.equal(status, 200)
+  assert.equal(body.stats.successful, 2)
+
+  const images = await getJobImages('job-valid-zip')
+  assert.deepEqual(images.map(image => image.filename), ['deflated.jpg', 'stored.jpg'])
+  assert.deepEqual(await fs.readFile(images[0].original_path), deflated)
+  assert.deepEqual(await fs.readFile(images[1].original_path), stored)
+})